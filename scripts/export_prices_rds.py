@@ -6,18 +6,34 @@ from an MS SQL database instead of parquet files in S3.
 """
 from __future__ import annotations
 import argparse
+import functools
+import io
 import json
+import os
 import pathlib
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import time
 from typing import List
 
-import boto3
-from botocore.exceptions import ClientError
+import numpy as np
 import pandas as pd
+import pyodbc
 import sqlalchemy as sa
 from urllib.parse import quote_plus
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
 FMT = "%Y-%m-%d %H:%M"
 OUT: dict[str, pathlib.Path]
 
@@ -30,10 +46,16 @@ SESSION_HOURS_NY = {
 }
 
 
+@functools.lru_cache(maxsize=None)
 def get_conn_from_secret(
     secret_name: str, region_name: str, default_driver: str
 ) -> str:
     """Return an SQLAlchemy connection string from AWS Secrets Manager."""
+    # Imported lazily: boto3 costs ~1 s at import and is dead weight when
+    # --conn is supplied or only --help is requested.
+    import boto3
+    from botocore.exceptions import ClientError
+
     session = boto3.session.Session()
     client = session.client(service_name="secretsmanager", region_name=region_name)
     try:
@@ -61,29 +83,132 @@ def get_conn_from_secret(
 
 
 def check_long_gaps(ts: pd.Series, limit_days: int = 5) -> None:
-    days = (
-        pd.to_datetime(ts)
-        .dt.normalize()
-        .drop_duplicates()
-        .sort_values()
-        .reset_index(drop=True)
-    )
-    if days.empty:
+    days = np.unique(ts.values.astype("datetime64[D]"))
+    if days.size < 2:
         return
-    diffs = days.diff().dt.days
-    gaps = diffs[diffs > limit_days]
-    for idx in gaps.index:
-        start = days.iloc[idx - 1].date()
-        end = days.iloc[idx].date()
-        print(f"Warning: gap {start} to {end} ({int(gaps.loc[idx])} days)")
+    diffs = np.diff(days).view("i8")
+    for idx in np.flatnonzero(diffs > limit_days):
+        print(
+            f"Warning: gap {days[idx]} to {days[idx + 1]} "
+            f"({int(diffs[idx])} days)"
+        )
 
 def frame(sec_id: int, ser: pd.Series) -> pd.DataFrame:
-    df = ser.rename("price").reset_index().rename(columns={"index": "timestamp"})
-    df.insert(0, "securityId", sec_id)
-    df["timestamp"] = (
-        pd.to_datetime(df["timestamp"], utc=True).dt.tz_convert("UTC").dt.strftime(FMT)
+    # Format straight off the DatetimeIndex: the index is already parsed,
+    # so round-tripping it through reset_index + to_datetime only re-parses
+    # what we have and allocates an extra object column.
+    ts = ser.index.tz_convert("UTC").strftime(FMT).to_numpy()
+    return pd.DataFrame(
+        {
+            "securityId": np.full(len(ser), sec_id, dtype=np.int64),
+            "timestamp": ts,
+            "price": ser.to_numpy(),
+        },
+        copy=False,
     )
-    return df
+
+
+def csv_chunk(sec_id: int, ser: pd.Series) -> bytes:
+    """Render one security's rows as CSV bytes.
+
+    Prefers pyarrow's columnar CSV writer, which formats Arrow buffers in
+    C with no per-row Python work; falls back to pandas when pyarrow is
+    not installed.
+    """
+    if pa is None:
+        return frame(sec_id, ser).to_csv(header=False, index=False).encode()
+    # Pre-format the prices and disable quoting so the bytes stay identical
+    # to the pandas formatter (and the committed sample universes): arrow's
+    # defaults quote the timestamps and drop the trailing .0 on integral
+    # floats, which would silently change the downstream file contract.
+    prices = ser.to_numpy()
+    price_str = prices.astype(str)
+    nan_mask = np.isnan(prices)
+    if nan_mask.any():
+        price_str[nan_mask] = ""
+    tbl = pa.table(
+        {
+            "securityId": pa.array(np.full(len(ser), sec_id, dtype=np.int64)),
+            "timestamp": pa.array(ser.index.tz_convert("UTC").strftime(FMT)),
+            "price": pa.array(price_str),
+        }
+    )
+    buf = io.BytesIO()
+    pacsv.write_csv(
+        tbl,
+        buf,
+        pacsv.WriteOptions(include_header=False, quoting_style="none"),
+    )
+    return buf.getvalue()
+
+
+def _emit_c_rows_py(
+    sids: np.ndarray, ts_buf: np.ndarray, rec_len: int, out: np.ndarray
+) -> int:
+    """Fill ``out`` with ``<sid>,<timestamp>\\n`` rows; returns bytes written.
+
+    ``ts_buf`` holds the pre-encoded ``,<timestamp>\\n`` records back to
+    back, each ``rec_len`` bytes wide (FMT is fixed-width). The sid is
+    written with a manual itoa so the whole file is produced without a
+    Python string per row; under numba this compiles to a tight native
+    loop.
+    """
+    n_rec = ts_buf.size // rec_len
+    digits = np.empty(20, dtype=np.uint8)
+    pos = 0
+    for i in range(sids.size):
+        v = sids[i]
+        nd = 0
+        if v == 0:
+            digits[0] = 48
+            nd = 1
+        else:
+            while v > 0:
+                digits[nd] = 48 + v % 10
+                v //= 10
+                nd += 1
+        for r in range(n_rec):
+            for d in range(nd - 1, -1, -1):
+                out[pos] = digits[d]
+                pos += 1
+            base = r * rec_len
+            for b in range(rec_len):
+                out[pos] = ts_buf[base + b]
+                pos += 1
+    return pos
+
+
+# Jit-compile the emitter when numba is around; the NumPy broadcast path
+# below remains the fallback (the interpreted loop would be slower).
+_emit_c_rows = numba.njit(cache=True)(_emit_c_rows_py) if numba is not None else None
+
+
+def writev_all(fh, chunks: List[bytes]) -> None:
+    """Flush ``chunks`` to ``fh`` with one scatter-gather writev call.
+
+    Handles short writes; on platforms without ``os.writev`` the chunks
+    are written sequentially. ``chunks`` is cleared once flushed.
+    """
+    if not hasattr(os, "writev"):
+        for chunk in chunks:
+            fh.write(chunk)
+        chunks.clear()
+        return
+    bufs = [memoryview(c) for c in chunks if c]
+    while bufs:
+        n = os.writev(fh.fileno(), bufs)
+        while bufs and n >= len(bufs[0]):
+            n -= len(bufs[0])
+            bufs.pop(0)
+        if n and bufs:
+            bufs[0] = bufs[0][n:]
+    chunks.clear()
+
+
+def dump_col(path: pathlib.Path, values, fmt=str) -> None:
+    """Write one value per line without spinning up the pandas CSV engine."""
+    path.write_bytes("".join(f"{fmt(v)}\n" for v in values).encode())
+
 
 def get_universe_info(
     engine: sa.engine.Engine, description: str
@@ -127,62 +252,145 @@ def get_subuniverse_data(
     )
     return sub_ids, members_df
 
-def read_price_bars(
-    engine: sa.engine.Engine,
-    security_id: int,
+def session_minute_bounds(session: str) -> tuple[int, int]:
+    """Return the session's (lo, hi) bounds as minutes-of-day in New York."""
+    start_t, end_t = SESSION_HOURS_NY[session]
+    lo = start_t.hour * 60 + start_t.minute
+    hi = end_t.hour * 60 + end_t.minute + 1
+    return lo, hi
+
+
+def session_mask(
+    ts: pd.Series, session: str, timeframe: int
+) -> np.ndarray:
+    """Return a boolean mask of bars whose end time falls inside the session."""
+    lo, hi = session_minute_bounds(session)
+    end_times = ts + pd.Timedelta(minutes=timeframe)
+    # Minute-of-day computed on the int64 nanosecond wall clock in one
+    # NumPy pass; the hour/minute accessors allocate an intermediate
+    # Series each and dispatch per call.
+    local = end_times.dt.tz_convert("America/New_York").dt.tz_localize(None)
+    minutes = (local.values.view("i8") // 60_000_000_000) % 1440
+    return (minutes >= lo) & (minutes <= hi)
+
+
+def _read_bars(
+    conn: sa.pool.PoolProxiedConnection,
+    table: str,
+    security_ids: List[int],
     start: str | None,
     session: str,
     timeframe: int = 60,
 ) -> pd.DataFrame:
-    params = {"sid": security_id, "tf": timeframe}
-    sql = (
-        "SELECT BarTimeUtc AS timestamp, [Close] AS [close] "
-        "FROM Intraday.mkt.PriceBar "
-        "WHERE SecurityId = :sid AND TimeframeMinute = :tf"
+    """Read bars for every security in ``security_ids`` with a single query.
+
+    Fetching the whole universe at once avoids one round-trip, query
+    compilation and cursor setup per security; rows are drained in
+    50k-row batches instead of buffering the full result client-side.
+    """
+    if not security_ids:
+        return pd.DataFrame(columns=["SecurityId", "timestamp", "close"])
+    lo, hi = session_minute_bounds(session)
+    end_et = (
+        "DATEADD(minute, ?, BarTimeUtc) AT TIME ZONE 'UTC' "
+        "AT TIME ZONE 'Eastern Standard Time'"
     )
-    if start:
-        sql += " AND BarTimeUtc >= :start"
-        params["start"] = start
-    sql += " ORDER BY BarTimeUtc"
-    df = pd.read_sql(sa.text(sql), engine, params=params)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    end_times = df["timestamp"] + pd.Timedelta(minutes=timeframe)
-    start, end = SESSION_HOURS_NY[session]
-    local = end_times.dt.tz_convert("America/New_York")
-    minutes = local.dt.hour * 60 + local.dt.minute
-    lo = start.hour * 60 + start.minute
-    hi = end.hour * 60 + end.minute + 1
-    mask = minutes.between(lo, hi)
+
+    # Fetch through the raw pyodbc cursor and build typed NumPy columns
+    # directly: pd.read_sql boxes every cell into a Python object and then
+    # re-infers dtypes, which dominates large bar pulls. SQL Server caps a
+    # statement at 2100 parameters, so the IN-list goes out in batches of
+    # 2000 ids; each security sits in exactly one batch, so the per-sid
+    # grouping downstream is unaffected.
+    sid_chunks: List[np.ndarray] = []
+    ts_chunks: List[np.ndarray] = []
+    close_chunks: List[np.ndarray] = []
+    cur = conn.cursor()
+    try:
+        cur.arraysize = 50_000
+        for ofs in range(0, len(security_ids), 2_000):
+            batch = security_ids[ofs : ofs + 2_000]
+            placeholders = ", ".join("?" for _ in batch)
+            sql = (
+                "SELECT SecurityId, BarTimeUtc, [Close] "
+                f"FROM {table} "
+                f"WHERE SecurityId IN ({placeholders}) "
+                "AND TimeframeMinute = ?"
+            )
+            params: List[object] = [int(sec_id) for sec_id in batch]
+            params.append(timeframe)
+            # Filter to session hours server-side so out-of-session rows
+            # are never serialized over the wire; AT TIME ZONE handles the
+            # ET/UTC DST shift. The client-side session_mask stays on as a
+            # safety net.
+            sql += (
+                f" AND DATEPART(hour, {end_et}) * 60"
+                f" + DATEPART(minute, {end_et}) BETWEEN ? AND ?"
+            )
+            params.extend([timeframe, timeframe, lo, hi])
+            if start:
+                sql += " AND BarTimeUtc >= ?"
+                params.append(start)
+            sql += " ORDER BY SecurityId, BarTimeUtc"
+            # Declare parameter types up front; otherwise the driver
+            # re-infers them per execute and SQL Server may recompile the
+            # plan whenever an inferred size changes.
+            sizes: List[tuple] = [(pyodbc.SQL_BIGINT, 0, 0)] * len(batch)
+            sizes.extend([(pyodbc.SQL_INTEGER, 0, 0)] * 5)
+            if start:
+                sizes.append((pyodbc.SQL_VARCHAR, 32, 0))
+            cur.setinputsizes(sizes)
+            cur.execute(sql, params)
+            while rows := cur.fetchmany(50_000):
+                sid_col, ts_col, close_col = zip(*rows)
+                sid_chunks.append(np.asarray(sid_col, dtype=np.int64))
+                # pyodbc hands back naive UTC datetimes; coerce them
+                # straight to datetime64 rather than routing through
+                # pd.to_datetime's object-path parser.
+                ts_chunks.append(
+                    np.asarray(ts_col, dtype="datetime64[us]").astype(
+                        "datetime64[ns]"
+                    )
+                )
+                close_chunks.append(np.asarray(close_col, dtype=np.float64))
+    finally:
+        cur.close()
+    if not sid_chunks:
+        return pd.DataFrame(columns=["SecurityId", "timestamp", "close"])
+    df = pd.DataFrame(
+        {
+            "SecurityId": np.concatenate(sid_chunks),
+            "timestamp": pd.DatetimeIndex(np.concatenate(ts_chunks), tz="UTC"),
+            "close": np.concatenate(close_chunks),
+        },
+        copy=False,
+    )
+    mask = session_mask(df["timestamp"], session, timeframe)
     return df[mask].copy()
 
 
+def read_price_bars(
+    conn: sa.pool.PoolProxiedConnection,
+    security_ids: List[int],
+    start: str | None,
+    session: str,
+    timeframe: int = 60,
+) -> pd.DataFrame:
+    return _read_bars(
+        conn, "Intraday.mkt.PriceBar", security_ids, start, session, timeframe
+    )
+
+
 def read_flat_bars(
-    engine: sa.engine.Engine,
-    security_id: int,
+    conn: sa.pool.PoolProxiedConnection,
+    security_ids: List[int],
     start: str | None,
     session: str,
     timeframe: int = 60,
 ) -> pd.DataFrame:
-    params = {"sid": security_id, "tf": timeframe}
-    sql = (
-        "SELECT BarTimeUtc AS timestamp, [Close] AS [close] "
-        "FROM Intraday.mkt.FlatBar "
-        "WHERE SecurityId = :sid AND TimeframeMinute = :tf"
+    return _read_bars(
+        conn, "Intraday.mkt.FlatBar", security_ids, start, session, timeframe
     )
-    if start:
-        sql += " AND BarTimeUtc >= :start"
-        params["start"] = start
-    sql += " ORDER BY BarTimeUtc"
-    df = pd.read_sql(sa.text(sql), engine, params=params)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    end_times = df["timestamp"] + pd.Timedelta(minutes=timeframe)
-    start_t, end_t = SESSION_HOURS_NY[session]
-    local = end_times.dt.tz_convert("America/New_York")
-    minutes = local.dt.hour * 60 + local.dt.minute
-    lo = start_t.hour * 60 + start_t.minute
-    hi = end_t.hour * 60 + end_t.minute + 1
-    mask = minutes.between(lo, hi)
-    return df[mask].copy()
 
 # ---------- CLI ----------
 cli = argparse.ArgumentParser()
@@ -247,60 +455,142 @@ if not universe_ids:
     sys.exit("No securities selected")
 
 sub_ids, sub_members = get_subuniverse_data(engine, universe_id)
-pd.Series(sub_ids).to_csv(OUT["E"], header=False, index=False)
+dump_col(OUT["E"], sub_ids)
 sub_members.to_csv(OUT["F"], header=False, index=False)
 
-all_ts: set[pd.Timestamp] = set()
+# Collect flat-bar timestamps as int64 nanosecond arrays; a set of
+# Python Timestamps means one boxed object plus one hash per bar.
+ts_chunks: List[np.ndarray] = []
 first_G = True
 
-for real_sid in universe_ids:
-    sid = real_sid
-    print("done", real_sid)
-
-    df_raw = read_price_bars(
-        engine, real_sid, start_filter, args.session, args.timeframe
+# Open each per-security output once; re-opening the files (and re-running
+# pandas' CSV header inference) for every security costs thousands of
+# needless open/close syscalls on big universes. Chunks are batched and
+# flushed with writev, so the handles themselves are unbuffered.
+writers = {k: OUT[k].open("wb", buffering=0) for k in ("A", "H")}
+pending: dict[str, List[bytes]] = {k: [] for k in writers}
+FLUSH_EVERY = 64
+
+# One connection for both bar pulls: a fresh pool checkout per query
+# renegotiates pyodbc/TLS state for nothing.
+bar_conn = engine.raw_connection()
+try:
+    raw_all = read_price_bars(
+        bar_conn, universe_ids, start_filter, args.session, args.timeframe
     )
-    check_long_gaps(df_raw["timestamp"], 5)
-    if df_raw.empty:
-        print(f"Skipping {real_sid}: no raw bars")
-        continue
-
-    df_flat = read_flat_bars(
-        engine, real_sid, start_filter, args.session, args.timeframe
+    flat_all = read_flat_bars(
+        bar_conn, universe_ids, start_filter, args.session, args.timeframe
     )
-    if df_flat.empty:
-        print(f"Skipping {real_sid}: no flat bars")
-        continue
-
+finally:
+    bar_conn.close()
+raw_groups = {sid: grp for sid, grp in raw_all.groupby("SecurityId", sort=False)}
+flat_groups = {sid: grp for sid, grp in flat_all.groupby("SecurityId", sort=False)}
+
+
+def format_security(real_sid: int):
+    """Build the CSV chunks for one security; runs on a worker thread."""
+    df_raw = raw_groups.get(real_sid)
+    if df_raw is None:
+        return real_sid, None, None, None, None
+    df_flat = flat_groups.get(real_sid)
+    if df_flat is None:
+        return real_sid, df_raw["timestamp"], None, None, None
     raw = df_raw.set_index("timestamp")["close"]
     flat = df_flat.set_index("timestamp")["close"]
-    all_ts.update(flat.index)
-
-    flat_frame = frame(sid, flat)
-    print(f"Writing {len(flat_frame)} rows to {OUT['A']}")
-    flat_frame.to_csv(OUT["A"], mode="a", header=False, index=False)
-
-    fraw = frame(sid, raw)
-    print(f"Writing {len(fraw)} rows to {OUT['H']} and {OUT['I']}")
-    fraw.to_csv(OUT["H"], mode="a", header=False, index=False)
-    fraw.to_csv(OUT["I"], mode="a", header=False, index=False)
-
-    if first_G:
-        fraw.to_csv(OUT["G"], header=False, index=False)
-        first_G = False
+    flat_chunk = csv_chunk(real_sid, flat)
+    raw_chunk = csv_chunk(real_sid, raw)
+    return real_sid, df_raw["timestamp"], flat.index, flat_chunk, raw_chunk
+
+
+# Formatting each security is independent, so fan it out across threads
+# (the heavy lifting is in pandas/NumPy C code which releases the GIL)
+# while this thread stays the sole writer, draining results in submission
+# order so the output files remain deterministic.
+pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+try:
+    for real_sid, raw_ts, flat_index, flat_chunk, raw_chunk in pool.map(
+        format_security, universe_ids
+    ):
+        sid = real_sid
+        print("done", real_sid)
+
+        if raw_ts is None:
+            print(f"Skipping {real_sid}: no raw bars")
+            continue
+        check_long_gaps(raw_ts, 5)
+        if flat_chunk is None:
+            print(f"Skipping {real_sid}: no flat bars")
+            continue
+
+        ts_chunks.append(flat_index.values.view("i8"))
+
+        print(f"Writing {len(flat_index)} rows to {OUT['A']}")
+        pending["A"].append(flat_chunk)
+
+        print(f"Writing {len(raw_ts)} rows to {OUT['H']} and {OUT['I']}")
+        pending["H"].append(raw_chunk)
+
+        for key, chunks in pending.items():
+            if len(chunks) >= FLUSH_EVERY:
+                writev_all(writers[key], chunks)
+
+        if first_G:
+            OUT["G"].write_bytes(raw_chunk)
+            first_G = False
+finally:
+    pool.shutdown()
+    for key, fh in writers.items():
+        writev_all(fh, pending[key])
+        fh.close()
+
+# I.txt is byte-for-byte identical to H.txt, so materialize it as a hard
+# link (zero-copy) rather than formatting and writing the data twice;
+# fall back to a copy on filesystems without link support.
+if OUT["I"].exists():
+    OUT["I"].unlink()
+try:
+    os.link(OUT["H"], OUT["I"])
+except OSError:
+    shutil.copyfile(OUT["H"], OUT["I"])
 
 # Auxiliary B C D
-pd.Series(universe_ids).to_csv(OUT["B"], header=False, index=False)
-
-ts_sorted = sorted(all_ts)
-ts_fmt = (
-    pd.to_datetime(ts_sorted, utc=True).tz_convert("UTC").strftime(FMT).tolist()
-)
-pd.Series(ts_fmt).to_csv(OUT["D"], header=False, index=False)
-with OUT["C"].open("w") as fhc:
-    for sid in sorted(universe_ids):
-        for t_str in ts_fmt:
-            fhc.write(f"{sid},{t_str}\n")
+dump_col(OUT["B"], universe_ids)
+
+if ts_chunks:
+    all_ts_i8 = np.unique(np.concatenate(ts_chunks))
+else:
+    all_ts_i8 = np.empty(0, dtype=np.int64)
+# Format the grid once as a NumPy string array; D is one bytes join over
+# it and the C emitter below reuses the same array instead of formatting
+# a second time.
+ts_sorted = pd.to_datetime(all_ts_i8, utc=True)
+ts_fmt = ts_sorted.strftime(FMT).to_numpy()
+if ts_fmt.size:
+    OUT["D"].write_bytes(b"\n".join(ts_fmt.astype("S")) + b"\n")
+else:
+    OUT["D"].write_bytes(b"")
+# Build the securityId x timestamp cross join by broadcasting in NumPy and
+# write it in one call; the nested Python loop formats and writes |N|*|T|
+# rows one at a time.
+sids_sorted = np.sort(np.asarray(universe_ids, dtype=np.int64))
+ts_arr = ts_fmt
+if not (sids_sorted.size and ts_arr.size):
+    OUT["C"].write_bytes(b"")
+elif _emit_c_rows is not None:
+    rec = "".join(f",{t}\n" for t in ts_fmt).encode()
+    rec_len = len(rec) // len(ts_fmt)
+    ts_buf = np.frombuffer(rec, dtype=np.uint8)
+    out_buf = np.empty(
+        sids_sorted.size * len(ts_fmt) * (rec_len + 20), dtype=np.uint8
+    )
+    n_bytes = _emit_c_rows(sids_sorted, ts_buf, rec_len, out_buf)
+    OUT["C"].write_bytes(out_buf[:n_bytes].tobytes())
+else:
+    rows = np.char.add(
+        np.char.add(np.repeat(sids_sorted.astype("U"), ts_arr.size), ","),
+        np.tile(ts_arr, sids_sorted.size),
+    )
+    OUT["C"].write_bytes(("\n".join(rows) + "\n").encode())
 
 for key in ["A", "H", "I"]:
     path = OUT[key]